@@ -4,13 +4,24 @@ import io
 import base64
 import json
 import datetime
+import copy
 import re
+import hashlib
+import uuid
 import traceback
+from collections import deque
+from itertools import islice
+from html.parser import HTMLParser
 from PIL import Image
 from dotenv import load_dotenv
 from visolearn_client import VisoLearnClient
 from fallback_mode import FallbackMode
 
+try:
+    import redis
+except ImportError:
+    redis = None
+
 # Load environment variables
 load_dotenv()
 
@@ -26,84 +37,304 @@ st.set_page_config(
 HF_TOKEN = os.environ.get("HF_TOKEN", "")
 PORT = int(os.environ.get("PORT", 5050))
 
-# Initialize session state variables if they don't exist
-if "active_session" not in st.session_state:
-    st.session_state.active_session = {
-        "prompt": None,
-        "image": None,
-        "chat": [],
-        "topic_focus": "",
-        "treatment_plan": "",
-        "key_details": [],
-        "identified_details": [],
-        "used_hints": [],
-        "difficulty": "Very Simple",
-        "autism_level": "Level 1",
-        "age": "3",
-        "attempt_count": 0,
-        "attempt_limit": 3,
-        "details_threshold": 70,
-        "image_style": "Realistic"
-    }
-
-if "saved_sessions" not in st.session_state:
-    st.session_state.saved_sessions = []
-
-if "checklist" not in st.session_state:
-    st.session_state.checklist = []
+# Optional Redis URL for sharing session state between app replicas
+REDIS_URL = os.environ.get("REDIS_URL", "")
+SESSION_TTL = 24 * 60 * 60
+
+# Reuse replies to repeated descriptions of the same image. A reused reply is not sent to the Space,
+# so its attempt counter does not advance for it
+CACHE_CHAT_RESPONSES = os.environ.get("CACHE_CHAT_RESPONSES", "") == "1"
+
+# Maximum number of conversation messages and per-image hints/details kept in a session
+MAX_HISTORY_MESSAGES = 200
+
+# Number of most recent conversation messages shown outside the "Earlier messages" expander
+RECENT_HISTORY_MESSAGES = 20
+
+# Session state keys shared through Redis as JSON. The client and token stay local,
+# and derived state (checklist counts/columns, the displayed image) is rebuilt on load
+SHARED_STATE_KEYS = (
+    "active_session",
+    "saved_sessions",
+    "checklist",
+    "conversation_history",
+    "debug_mode",
+    "fallback_mode"
+)
 
-if "conversation_history" not in st.session_state:
-    st.session_state.conversation_history = []
+# Default active session used before any image is generated
+DEFAULT_ACTIVE_SESSION = {
+    "prompt": None,
+    "image": None,
+    "chat": [],
+    "topic_focus": "",
+    "treatment_plan": "",
+    "key_details": [],
+    "identified_details": deque(maxlen=MAX_HISTORY_MESSAGES),
+    "used_hints": deque(maxlen=MAX_HISTORY_MESSAGES),
+    "difficulty": "Very Simple",
+    "autism_level": "Level 1",
+    "age": "3",
+    "attempt_count": 0,
+    "attempt_limit": 3,
+    "details_threshold": 70,
+    "image_style": "Realistic"
+}
+
+# Default values for session state variables
+SESSION_DEFAULTS = {
+    "active_session": DEFAULT_ACTIVE_SESSION,
+    "saved_sessions": [],
+    "checklist": [],
+    "checklist_stats": (0, 0),
+    "checklist_columns": ((), ()),
+    "conversation_history": deque(maxlen=MAX_HISTORY_MESSAGES),
+    "generated_image": None,
+    "client": None,
+    "is_connected": False,
+    "connection_error": None,
+    "hf_token": HF_TOKEN,
+    "debug_mode": False,
+    "fallback_mode": False
+}
 
-if "generated_image" not in st.session_state:
-    st.session_state.generated_image = None
+# Initialize session state variables if they don't exist
+for key, value in SESSION_DEFAULTS.items():
+    if key not in st.session_state:
+        # Copy mutable defaults so sessions never share the same list or dict
+        st.session_state[key] = copy.deepcopy(value) if isinstance(value, (list, dict, deque)) else value
+
+# Function to get the shared Redis connection, if configured
+@st.cache_resource(show_spinner=False)
+def _redis():
+    """
+    Connect to Redis when REDIS_URL is set, otherwise keep state in memory only
+    """
+    if not REDIS_URL:
+        return None
+    if redis is None:
+        print("REDIS_URL is set but the redis package is not installed. Using in-memory session state.")
+        return None
+    return redis.Redis.from_url(REDIS_URL)
+
+# Function to get the id used to key shared session state
+def _get_session_id():
+    """
+    Read the session id from the query string, creating one if needed
+    """
+    session_id = st.query_params.get("session_id")
+    if not session_id:
+        session_id = uuid.uuid4().hex
+        st.query_params["session_id"] = session_id
+    return session_id
+
+# Function to serialize the shared session state as JSON
+def _encode_state():
+    """
+    Serialize the shared session state keys to a JSON string
+    """
+    state = {key: st.session_state[key] for key in SHARED_STATE_KEYS if key in st.session_state}
+    if "checklist" in state:
+        # Keyword sets are derived from the detail text and rebuilt when needed
+        state["checklist"] = [
+            {key: value for key, value in item.items() if not key.startswith("_")}
+            for item in state["checklist"]
+        ]
+    # Deques and tuples are stored as JSON lists
+    return json.dumps(state, default=list)
+
+# Function to restore shared session state from JSON
+def _decode_state(data):
+    """
+    Parse JSON session state, rebuilding the deques and tuples it was saved from
+    """
+    state = json.loads(data)
+    if "active_session" in state:
+        active_session = state["active_session"]
+        for key in ("identified_details", "used_hints"):
+            active_session[key] = deque(active_session.get(key) or [], maxlen=MAX_HISTORY_MESSAGES)
+    if "conversation_history" in state:
+        state["conversation_history"] = deque(
+            (tuple(entry) for entry in state["conversation_history"]),
+            maxlen=MAX_HISTORY_MESSAGES
+        )
+    return state
 
-if "client" not in st.session_state:
-    st.session_state.client = None
+# Function to restore session state saved by any replica
+def _load_state(session_id):
+    try:
+        data = _redis().get(f"visolearn:session:{session_id}")
+        if not data:
+            return
+        for key, value in _decode_state(data).items():
+            if key == "checklist":
+                set_checklist(value)
+            else:
+                st.session_state[key] = value
+        
+        # Rebuild the displayed image from the session's image reference
+        image_url = st.session_state.active_session.get("image")
+        if image_url and not st.session_state.generated_image:
+            st.session_state.generated_image = {"url": image_url}
+        
+        st.session_state.shared_state_digest = hashlib.sha1(data).hexdigest()
+    except Exception as e:
+        print(f"Error loading shared session state: {str(e)}")
 
-if "is_connected" not in st.session_state:
-    st.session_state.is_connected = False
+# Function to save session state for other replicas
+def _save_state(session_id):
+    try:
+        data = _encode_state().encode("utf-8")
+        
+        # Skip the write when nothing changed since the last load or save
+        digest = hashlib.sha1(data).hexdigest()
+        if digest == st.session_state.get("shared_state_digest"):
+            return
+        
+        _redis().setex(f"visolearn:session:{session_id}", SESSION_TTL, data)
+        st.session_state.shared_state_digest = digest
+    except Exception as e:
+        print(f"Error saving shared session state: {str(e)}")
 
-if "connection_error" not in st.session_state:
-    st.session_state.connection_error = None
+# Pattern for checklist items in the HTML returned by the API
+_CHECKLIST_RE = re.compile(r'<div class="checklist-item ([^"]+)">\s*<span class="checkmark">([^<]+)</span>\s*<span>([^<]+)</span>\s*</div>')
 
-if "hf_token" not in st.session_state:
-    st.session_state.hf_token = HF_TOKEN
+class _ChecklistParser(HTMLParser):
+    """
+    Single-pass parser that collects checklist items from the checklist HTML
+    """
     
-if "debug_mode" not in st.session_state:
-    st.session_state.debug_mode = False
-
-if "fallback_mode" not in st.session_state:
-    st.session_state.fallback_mode = False
+    def __init__(self):
+        super().__init__()
+        self.items = []
+        self.in_item = False
+        self.in_detail = False
+        self.current_classes = []
+        self.buffer = []
+    
+    def handle_starttag(self, tag, attrs):
+        classes = (dict(attrs).get("class") or "").split()
+        if tag == "div" and "checklist-item" in classes:
+            self.in_item = True
+            self.current_classes = classes
+            self.buffer = []
+        elif tag == "span" and self.in_item and "checkmark" not in classes:
+            self.in_detail = True
+    
+    def handle_endtag(self, tag):
+        if tag == "span":
+            self.in_detail = False
+        elif tag == "div" and self.in_item:
+            detail = "".join(self.buffer).strip()
+            if detail:
+                self.items.append({
+                    "detail": detail,
+                    "identified": "identified" in self.current_classes,
+                    "id": len(self.items)
+                })
+            self.in_item = False
+    
+    def handle_data(self, data):
+        if self.in_detail:
+            self.buffer.append(data)
 
 # Function to extract details from HTML content
+@st.cache_data(max_entries=128, show_spinner=False)
 def extract_checklist_from_html(html_content):
     """
-    Extract checklist items from HTML content returned by the API
+    Extract checklist items from HTML content returned by the API.
+    Results are cached per payload; st.cache_data hands back a fresh copy on each hit.
     """
     checklist = []
     if not html_content:
         return checklist
     
-    # Use regex to find checklist items
-    pattern = r'<div class="checklist-item ([^"]+)">\s*<span class="checkmark">([^<]+)</span>\s*<span>([^<]+)</span>\s*</div>'
-    matches = re.findall(pattern, html_content)
+    # Walk the HTML once with the streaming parser
+    parser = _ChecklistParser()
+    parser.feed(html_content)
+    parser.close()
+    if parser.items:
+        return parser.items
+    
+    # Fall back to the regex if the parser found nothing
+    matches = _CHECKLIST_RE.findall(html_content)
     
     for i, match in enumerate(matches):
         css_class, checkmark, detail = match
-        identified = "identified" in css_class
+        # "not-identified" also contains "identified", so match the prefix
+        identified = css_class.startswith("identified")
         checklist.append({"detail": detail, "identified": identified, "id": i})
     
     return checklist
 
+# Function to store the checklist together with its progress counts
+def set_checklist(checklist):
+    """
+    Replace the checklist and refresh the derived (details, identified) columns
+    and the cached (identified, total) counts used by the render code
+    """
+    details = tuple(item["detail"] for item in checklist)
+    identified = tuple(item["identified"] for item in checklist)
+    
+    st.session_state.checklist = checklist
+    st.session_state.checklist_columns = (details, identified)
+    st.session_state.checklist_stats = (sum(identified), len(identified))
+
+# Function to decode image data URLs once per URL
+@st.cache_data(max_entries=16, show_spinner=False)
+def _decode_data_url(url):
+    """
+    Decode a base64 image data URL to a PIL Image, cached so reruns skip the decode
+    """
+    return VisoLearnClient.process_data_url(url)
+
+# Connection error keywords (lowercase) and the explanation shown for each, checked in order
+CONNECTION_ERROR_MESSAGES = (
+    ("403", ": You don't have permission to access this private space. Please check that your token has the correct permissions."),
+    ("401", ": Invalid or unauthorized token. Please check your Hugging Face token."),
+    ("404", ": Space not found. The VisoLearn space may have been moved or renamed."),
+    ("sleeping", ": The space is sleeping. Trying to wake it up, please wait a moment and try again."),
+    ("not running", ": The space is not running. Please wait a moment and try again.")
+)
+
+# Function to answer repeated descriptions of the same image from cache
+@st.cache_data(ttl=300, max_entries=256, show_spinner=False)
+def _cached_chat(topic_focus, image_url, user_message, _client, _sent):
+    """
+    Send a chat message, reusing the reply for identical (topic, image, message) keys.
+    _sent is a list that gets an entry only when the message actually reached the Space
+    """
+    _sent.append(True)
+    return _client.chat_respond(user_message)
+
+# Function to drop this session's client so the next call reconnects
+def reset_client():
+    """
+    Forget the current client, e.g. after an API error, so the next action
+    re-runs VisoLearnClient.initialize() (including waking a sleeping Space)
+    """
+    st.session_state.client = None
+
 # Function to initialize Gradio client
 def initialize_client():
+    """
+    Connect this session's client, reusing an existing healthy connection.
+    Call reset_client() first to force a new client (e.g. to wake the Space).
+    """
     if not st.session_state.hf_token:
         st.error("⚠️ Hugging Face token is required. Please enter your token in the sidebar.")
         st.session_state.connection_error = "Missing Hugging Face token"
         st.session_state.is_connected = False
         return False
     
+    # Reuse this session's client unless the token changed or the last attempt failed.
+    # Each browser session keeps its own client, since the Space keeps per-client chat state
+    if (st.session_state.is_connected
+            and st.session_state.client is not None
+            and not st.session_state.connection_error
+            and st.session_state.client.hf_token == st.session_state.hf_token):
+        return True
+    
     try:
         st.session_state.client = VisoLearnClient(hf_token=st.session_state.hf_token)
         st.session_state.is_connected = True
@@ -114,18 +345,14 @@ def initialize_client():
         detailed_error = str(e)
         st.session_state.connection_error = detailed_error
         st.session_state.is_connected = False
+        reset_client()
         
         error_message = "⚠️ Failed to connect to VisoLearn API"
-        if "403" in detailed_error:
-            error_message += ": You don't have permission to access this private space. Please check that your token has the correct permissions."
-        elif "401" in detailed_error:
-            error_message += ": Invalid or unauthorized token. Please check your Hugging Face token."
-        elif "404" in detailed_error:
-            error_message += ": Space not found. The VisoLearn space may have been moved or renamed."
-        elif "sleeping" in detailed_error.lower():
-            error_message += ": The space is sleeping. Trying to wake it up, please wait a moment and try again."
-        elif "not running" in detailed_error.lower():
-            error_message += ": The space is not running. Please wait a moment and try again."
+        lowered_error = detailed_error.lower()
+        for keyword, suffix in CONNECTION_ERROR_MESSAGES:
+            if keyword in lowered_error:
+                error_message += suffix
+                break
         else:
             error_message += f": {detailed_error}"
             
@@ -147,40 +374,52 @@ def toggle_fallback_mode():
         # Try to reconnect
         initialize_client()
 
+# Function to reset the active session for a newly generated image
+def _build_active_session(prompt, url):
+    """
+    Reset the active session in place for a new image, keeping any extra keys
+    """
+    attempt_limit = int(st.session_state.attempt_limit)
+    details_threshold = float(st.session_state.details_threshold)
+    
+    st.session_state.active_session.update({
+        "prompt": prompt,
+        "image": url,
+        "chat": [],
+        "topic_focus": st.session_state.topic_focus,
+        "treatment_plan": st.session_state.treatment_plan,
+        "key_details": [],
+        "identified_details": deque(maxlen=MAX_HISTORY_MESSAGES),
+        "used_hints": deque(maxlen=MAX_HISTORY_MESSAGES),
+        "difficulty": "Very Simple",
+        "autism_level": st.session_state.autism_level,
+        "age": st.session_state.age,
+        "attempt_count": 0,
+        "attempt_limit": attempt_limit,
+        "details_threshold": details_threshold,
+        "image_style": st.session_state.image_style
+    })
+
 # Function to generate image
 def generate_image():
     if st.session_state.fallback_mode:
         # Use fallback mode to generate a placeholder image
         image_text = f"Sample Image: {st.session_state.topic_focus}" if st.session_state.topic_focus else "Sample Image"
+        # Rendering is memoized in-process by fallback_mode, so a repeated topic is served from memory
         result = FallbackMode.generate_placeholder_image(text=image_text)
         
         if result:
             st.session_state.generated_image = result
             
             # Update active session
-            st.session_state.active_session = {
-                "prompt": "Generated placeholder image (fallback mode)",
-                "image": result.get('url', None),
-                "chat": [],
-                "topic_focus": st.session_state.topic_focus,
-                "treatment_plan": st.session_state.treatment_plan,
-                "key_details": [],
-                "identified_details": [],
-                "used_hints": [],
-                "difficulty": "Very Simple",
-                "autism_level": st.session_state.autism_level,
-                "age": st.session_state.age,
-                "attempt_count": 0,
-                "attempt_limit": int(st.session_state.attempt_limit),
-                "details_threshold": float(st.session_state.details_threshold),
-                "image_style": st.session_state.image_style
-            }
+            # Keep a data URL reference to the image, as in API mode; the PNG is small
+            _build_active_session("Generated placeholder image (fallback mode)", FallbackMode.to_data_url(result))
             
             # Create a placeholder checklist
-            st.session_state.checklist = FallbackMode.generate_placeholder_checklist(st.session_state.topic_focus)
+            set_checklist(FallbackMode.generate_placeholder_checklist(st.session_state.topic_focus))
             
             # Clear conversation history
-            st.session_state.conversation_history = []
+            st.session_state.conversation_history.clear()
             
             return True
     else:
@@ -208,29 +447,13 @@ def generate_image():
                     st.session_state.generated_image = result
                     
                     # Update active session
-                    st.session_state.active_session = {
-                        "prompt": "Generated image",
-                        "image": result.get('url', None),
-                        "chat": [],
-                        "topic_focus": st.session_state.topic_focus,
-                        "treatment_plan": st.session_state.treatment_plan,
-                        "key_details": [],
-                        "identified_details": [],
-                        "used_hints": [],
-                        "difficulty": "Very Simple",
-                        "autism_level": st.session_state.autism_level,
-                        "age": st.session_state.age,
-                        "attempt_count": 0,
-                        "attempt_limit": int(st.session_state.attempt_limit),
-                        "details_threshold": float(st.session_state.details_threshold),
-                        "image_style": st.session_state.image_style
-                    }
+                    _build_active_session("Generated image", result.get('url', None))
                     
                     # Update checklist
                     update_checklist()
                     
                     # Clear conversation history
-                    st.session_state.conversation_history = []
+                    st.session_state.conversation_history.clear()
                     
                     return True
                 else:
@@ -239,6 +462,7 @@ def generate_image():
                         st.write("API Response:", result)
                     return False
             except Exception as e:
+                reset_client()
                 st.error(f"Error generating image: {str(e)}")
                 if st.session_state.debug_mode:
                     st.expander("Detailed Error").code(traceback.format_exc())
@@ -251,7 +475,11 @@ def generate_image():
                 return False
 
 # Function to update checklist
-def update_checklist():
+def update_checklist(html_content=None):
+    """
+    Refresh the checklist from the API. If html_content is given (e.g. returned
+    with the chat reply) it is parsed directly and no new request is made.
+    """
     if st.session_state.fallback_mode:
         # In fallback mode, we've already created the checklist when generating the image
         return
@@ -261,21 +489,25 @@ def update_checklist():
     
     try:
         # Get checklist data from the API
-        html_content = st.session_state.client.update_checklist()
+        if html_content is None:
+            html_content = st.session_state.client.update_checklist()
         
         # Extract checklist items from HTML
-        st.session_state.checklist = extract_checklist_from_html(html_content)
+        checklist = extract_checklist_from_html(html_content)
         
         # If no items extracted, create placeholder items
-        if not st.session_state.checklist and st.session_state.active_session and st.session_state.active_session["image"]:
+        if not checklist and st.session_state.active_session and st.session_state.active_session["image"]:
             # Placeholder items
-            st.session_state.checklist = [
+            checklist = [
                 {"detail": "Object in image", "identified": False, "id": 0},
                 {"detail": "Color", "identified": False, "id": 1},
                 {"detail": "Shape", "identified": False, "id": 2},
                 {"detail": "Background", "identified": False, "id": 3}
             ]
+        
+        set_checklist(checklist)
     except Exception as e:
+        reset_client()
         st.error(f"Error updating checklist: {str(e)}")
         if st.session_state.debug_mode:
             st.expander("Detailed Error").code(traceback.format_exc())
@@ -286,18 +518,8 @@ def update_progress():
         return "No active session or no details to identify."
     
     try:
-        # Try to get progress HTML from API if connected
-        if st.session_state.is_connected and not st.session_state.fallback_mode:
-            try:
-                progress_html = st.session_state.client.update_progress()
-            except:
-                progress_html = None
-        else:
-            progress_html = None
-            
-        # Fall back to local calculation if API call fails or not connected
-        total_items = len(st.session_state.checklist)
-        identified_items = sum(1 for item in st.session_state.checklist if item["identified"])
+        # Progress is computed locally from the checklist; the API's progress HTML is not needed
+        identified_items, total_items = st.session_state.checklist_stats
         percentage = (identified_items / total_items) * 100 if total_items > 0 else 0
         
         return f"Progress: {identified_items}/{total_items} details ({percentage:.1f}%)"
@@ -325,11 +547,10 @@ def process_chat_message():
         )
         
         # Update the checklist
-        st.session_state.checklist = updated_checklist
+        set_checklist(updated_checklist)
         
         # Add messages to conversation history
-        st.session_state.conversation_history.append(("Child", user_message))
-        st.session_state.conversation_history.append(("Teacher", response))
+        st.session_state.conversation_history.extend((("Child", user_message), ("Teacher", response)))
         
         # Update active session - handle attempt count
         attempt_count = st.session_state.active_session.get("attempt_count", 0)
@@ -354,19 +575,36 @@ def process_chat_message():
     
     user_message = st.session_state.message.strip()
     
-    with st.spinner("Processing response... This may take a moment."):
+    with st.status("Thinking… This may take a moment.", expanded=False) as status:
         try:
-            result = st.session_state.client.chat_respond(user_message)
+            sent = [True]
+            if CACHE_CHAT_RESPONSES:
+                sent = []
+                result = _cached_chat(
+                    st.session_state.active_session.get("topic_focus", ""),
+                    st.session_state.active_session.get("image"),
+                    user_message,
+                    st.session_state.client,
+                    sent
+                )
+            else:
+                result = st.session_state.client.chat_respond(user_message)
             
             if result and isinstance(result, tuple) and len(result) >= 2:
+                # Use the checklist HTML if the chat reply already includes it. A reused
+                # reply only supplies its text; the checklist is fetched live and the
+                # image is kept, since both may have changed since it was cached
+                checklist_html = None
+                if sent and len(result) > 3 and isinstance(result[3], str) and "checklist-item" in result[3]:
+                    checklist_html = result[3]
+                
                 # Extract data from result
                 ai_response = result[0]
                 conversation = result[1] if len(result) > 1 else None
-                image_data = result[2] if len(result) > 2 else None
+                image_data = result[2] if sent and len(result) > 2 else None
                 
                 # Add messages to conversation history
-                st.session_state.conversation_history.append(("Child", user_message))
-                st.session_state.conversation_history.append(("Teacher", ai_response))
+                st.session_state.conversation_history.extend((("Child", user_message), ("Teacher", ai_response)))
                 
                 # Update active session - handle attempt count
                 attempt_count = st.session_state.active_session.get("attempt_count", 0)
@@ -380,17 +618,22 @@ def process_chat_message():
                 st.session_state.message = ""
                 
                 # Update checklist based on response
-                update_checklist()
+                update_checklist(checklist_html)
                 
                 # Update image if a new one is returned
                 if image_data and 'url' in image_data:
                     st.session_state.generated_image = image_data
                     st.session_state.active_session["image"] = image_data.get('url')
+                
+                status.update(label="Response received", state="complete")
             else:
+                status.update(label="Failed to process chat", state="error", expanded=True)
                 st.error("Failed to process chat. The API returned an invalid response.")
                 if st.session_state.debug_mode:
                     st.write("API Response:", result)
         except Exception as e:
+            reset_client()
+            status.update(label="Failed to process chat", state="error", expanded=True)
             st.error(f"Error processing chat: {str(e)}")
             if st.session_state.debug_mode:
                 st.expander("Detailed Error").code(traceback.format_exc())
@@ -416,6 +659,7 @@ def save_session_log():
             result = st.session_state.client.save_session_log()
             st.success("✅ Session log saved successfully")
         except Exception as e:
+            reset_client()
             st.error(f"Error saving session log: {str(e)}")
             if st.session_state.debug_mode:
                 st.expander("Detailed Error").code(traceback.format_exc())
@@ -434,6 +678,7 @@ def save_session_images():
             result = st.session_state.client.save_all_session_images()
             st.success("✅ Session images saved successfully")
         except Exception as e:
+            reset_client()
             st.error(f"Error saving session images: {str(e)}")
             if st.session_state.debug_mode:
                 st.expander("Detailed Error").code(traceback.format_exc())
@@ -444,8 +689,30 @@ def toggle_debug_mode():
 
 # Function to validate token
 def validate_token():
+    # Always reconnect, so Validate re-checks the token and wakes a sleeping Space
+    reset_client()
     initialize_client()
 
+# Function to render one conversation message
+def render_chat_message(speaker, message):
+    if speaker == "Child":
+        with st.chat_message("user", avatar="👧"):
+            st.write(f"**Child:** {message}")
+    else:
+        with st.chat_message("assistant", avatar="👩‍🏫"):
+            st.write(f"**Teacher:** {message}")
+
+# Restore shared session state once per browser session
+if _redis() is not None and "shared_state_loaded" not in st.session_state:
+    _load_state(_get_session_id())
+    st.session_state.shared_state_loaded = True
+
+# Save shared session state for other replicas. Shared keys only change in widget
+# callbacks, which run before the script, so saving here is not skipped when the
+# page body raises or calls st.stop()
+if _redis() is not None:
+    _save_state(_get_session_id())
+
 # Sidebar for configuration
 with st.sidebar:
     st.title("VisoLearn Local Interface")
@@ -539,22 +806,30 @@ col1, col2 = st.columns([2, 1])
 
 with col1:
     st.header("Generated Image")
+    # Show a light placeholder right away and fill it once the image is ready
+    image_slot = st.empty()
+    image_slot.markdown("✨ loading…")
     if st.session_state.generated_image:
-        if 'url' in st.session_state.generated_image and st.session_state.generated_image['url']:
+        if st.session_state.generated_image.get('bytes'):
+            # Raw image bytes (fallback mode) can be shown without a base64 round-trip
+            image_slot.image(st.session_state.generated_image['bytes'], use_container_width=True)
+        elif 'url' in st.session_state.generated_image and st.session_state.generated_image['url']:
             url = st.session_state.generated_image['url']
             if url.startswith('data:image'):
-                image = VisoLearnClient.process_data_url(url)
+                image = _decode_data_url(url)
                 if image:
-                    st.image(image, use_container_width=True)
+                    image_slot.image(image, use_container_width=True)
                 else:
-                    st.error("Could not display the image. The image data may be corrupted.")
+                    image_slot.error("Could not display the image. The image data may be corrupted.")
             else:
                 try:
-                    st.image(url, use_container_width=True)
+                    image_slot.image(url, use_container_width=True)
                 except Exception as e:
-                    st.error(f"Could not load image from URL: {str(e)}")
+                    image_slot.error(f"Could not load image from URL: {str(e)}")
+        else:
+            image_slot.empty()
     else:
-        st.info("Generate an image to start the session")
+        image_slot.info("Generate an image to start the session")
     
     # Chat interface
     st.header("Child's Description")
@@ -567,28 +842,36 @@ with col1:
     
     # Display conversation history
     st.header("Conversation History")
+    history_slot = st.empty()
+    history_slot.markdown("✨ loading…")
     if st.session_state.conversation_history:
-        for i, (speaker, message) in enumerate(st.session_state.conversation_history):
-            if speaker == "Child":
-                with st.container(border=True):
-                    st.write(f"👧 **Child:** {message}")
-            else:
-                with st.container(border=True):
-                    st.write(f"👩‍🏫 **Teacher:** {message}")
+        history = st.session_state.conversation_history
+        with history_slot.container():
+            # Keep older messages collapsed so each rerun only renders the recent ones
+            earlier_count = max(0, len(history) - RECENT_HISTORY_MESSAGES)
+            if earlier_count:
+                with st.expander("Earlier messages"):
+                    for speaker, message in islice(history, earlier_count):
+                        render_chat_message(speaker, message)
+            for speaker, message in islice(history, earlier_count, None):
+                render_chat_message(speaker, message)
     else:
-        st.info("No conversation yet. Generate an image and describe what you see.")
+        history_slot.info("No conversation yet. Generate an image and describe what you see.")
 
 with col2:
     # Display details to identify
     st.header("Details to Identify")
+    checklist_slot = st.empty()
+    checklist_slot.markdown("✨ loading…")
     if st.session_state.checklist:
-        for item in st.session_state.checklist:
-            if item["identified"]:
-                st.success(f"✅ {item['detail']}")
-            else:
-                st.warning(f"❌ {item['detail']}")
+        with checklist_slot.container():
+            for detail, identified in zip(*st.session_state.checklist_columns):
+                if identified:
+                    st.success(f"✅ {detail}")
+                else:
+                    st.warning(f"❌ {detail}")
     else:
-        st.info("Generate an image to see details to identify")
+        checklist_slot.info("Generate an image to see details to identify")
     
     # Progress tracking
     st.header("Progress")
@@ -599,8 +882,7 @@ with col2:
         
         # Create a visual progress bar
         if st.session_state.checklist:
-            total_items = len(st.session_state.checklist)
-            identified_items = sum(1 for item in st.session_state.checklist if item["identified"])
+            identified_items, total_items = st.session_state.checklist_stats
             percentage = (identified_items / total_items) * 100 if total_items > 0 else 0
             # Cap the progress value at 100% (1.0) to avoid StreamlitAPIException
             progress_value = min(1.0, percentage / 100)
@@ -628,7 +910,8 @@ with col2:
             # Show warning if limit is reached
             if attempt_count >= attempt_limit:
                 # Check if not all items are identified
-                if not all(item["identified"] for item in st.session_state.checklist):
+                identified_items, total_items = st.session_state.checklist_stats
+                if identified_items < total_items:
                     st.warning("⚠️ Maximum attempts reached. The next interaction will move to a new image.")
         else:
             st.write("Attempts: 0/0")
@@ -643,8 +926,8 @@ if st.session_state.active_session:
         "Image Style": st.session_state.active_session.get("image_style", "Realistic"),
         "Autism Level": st.session_state.active_session.get("autism_level", "Level 1"),
         "Age": st.session_state.active_session.get("age", "3"),
-        "Identified Details": len([item for item in st.session_state.checklist if item["identified"]]),
-        "Total Details": len(st.session_state.checklist),
+        "Identified Details": st.session_state.checklist_stats[0],
+        "Total Details": st.session_state.checklist_stats[1],
         "Fallback Mode": st.session_state.fallback_mode
     }
     st.json(display_session)
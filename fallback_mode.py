@@ -2,9 +2,183 @@ import os
 import base64
 import json
 import io
+import re
 import random
+import sys
+import zlib
+import functools
+from importlib import metadata
 from PIL import Image, ImageDraw, ImageFont
 
+# Use the SIMD-accelerated base64 codec when it is installed
+try:
+    import pybase64
+except ImportError:
+    pybase64 = None
+
+# Report which Pillow build is active so a silent fallback from Pillow-SIMD is visible
+try:
+    metadata.version("Pillow-SIMD")
+    print(f"Using Pillow-SIMD {Image.__version__} for placeholder images")
+except metadata.PackageNotFoundError:
+    print(f"Using stock Pillow {Image.__version__} for placeholder images (install Pillow-SIMD for faster drawing)")
+
+# Candidate system fonts, tried in order (Windows, macOS, Linux)
+_FONT_SEARCH_PATHS = (
+    "C:\\Windows\\Fonts\\Arial.ttf",
+    "/System/Library/Fonts/Helvetica.ttc",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+)
+
+@functools.lru_cache(maxsize=4)
+def _get_font(size):
+    """
+    Load the first available system font at the given size, once per process
+    """
+    for font_path in _FONT_SEARCH_PATHS:
+        if os.path.exists(font_path):
+            try:
+                return ImageFont.truetype(font_path, size)
+            except Exception:
+                break
+    return ImageFont.load_default()
+
+# Outline color for the placeholder border
+_BORDER_COLOR = (180, 180, 180)
+
+# Default bitmap font used for small labels, loaded once at import
+_SMALL_FONT = ImageFont.load_default()
+
+# Opening container for the checklist HTML
+HEADER_HTML = '<div id="checklist-container" style="background-color: #000000; color: #ffffff; padding: 15px; border-radius: 8px;">'
+
+# Styles for the checklist items, minified once at module load
+CHECKLIST_CSS = '<style>' + re.sub(r"\s*([{};:,])\s*", r"\1", (
+    '.checklist-item {display: flex; align-items: center; margin-bottom: 10px; padding: 8px; border-radius: 5px; transition: background-color 0.3s;} '
+    '.identified {background-color: #1e4620; text-decoration: line-through; color: #7fff7f;} '
+    '.not-identified {background-color: #222222; color: #ffffff;} '
+    '.checkmark {margin-right: 10px; font-size: 1.2em;}'
+)).strip() + '</style>'
+
+# Markup for a single checklist item
+ITEM_TEMPLATE = '<div class="checklist-item {cls}"><span class="checkmark">{mk}</span><span>{d}</span></div>'
+
+# Generic details that could apply to many images
+GENERIC_DETAILS = (
+    "Background color",
+    "Main subject",
+    "Foreground elements",
+    "Lighting effects",
+    "Shadows and highlights",
+    "Texture patterns",
+    "Color scheme"
+)
+
+# Topic categories as (name, topic keywords, details), checked in order
+_CATEGORIES = (
+    ("animals", frozenset({"animal", "animals", "pet", "pets", "wildlife"}),
+     ("Animal type", "Animal posture", "Animal coloring", "Habitat elements", "Animal features")),
+    ("people", frozenset({"person", "people", "child", "children", "family"}),
+     ("Person's expression", "Clothing items", "Posture or pose", "Hair style", "Action being performed")),
+    ("nature", frozenset({"nature", "landscape", "tree", "forest", "mountain", "ocean"}),
+     ("Type of landscape", "Plant life", "Weather conditions", "Time of day", "Natural features")),
+    ("objects", frozenset({"object", "toy", "item", "tool"}),
+     ("Object shape", "Object purpose", "Object material", "Object size", "Object color"))
+)
+
+# Words of four or more letters, used to match chat messages to checklist details
+_KEYWORD_RE = re.compile(r"[a-z]{4,}")
+
+def _keywords(text):
+    """
+    Return the set of matchable keywords in a piece of text.
+    A trailing "s" is dropped so plurals and singulars match ("colors" / "color").
+    """
+    return frozenset(word[:-1] if word.endswith("s") else word for word in _KEYWORD_RE.findall(text.lower()))
+
+@functools.lru_cache(maxsize=256)
+def _measure(text, font_size):
+    """
+    Return the (width, height) extent of text drawn at the origin with the placeholder font
+    """
+    font = _get_font(font_size)
+    dummy = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+    return dummy.textbbox((0, 0), text, font=font)[2:]
+
+def _topic_rng(topic):
+    """
+    Return a random generator seeded from the topic, stable across processes
+    """
+    return random.Random(zlib.crc32((topic or "").encode("utf-8")))
+
+@functools.lru_cache(maxsize=128)
+def _placeholder_details(topic):
+    """
+    Select the placeholder details for a topic as a tuple of (detail, keywords) pairs
+    """
+    # Add topic-specific details if a topic is provided
+    topic_details = ()
+    if topic and topic != "Unknown":
+        topic_words = frozenset(topic.lower().split())
+        
+        # Use the details of the first category whose keywords appear in the topic
+        for name, keywords, details in _CATEGORIES:
+            if topic_words & keywords:
+                topic_details = details
+                break
+    
+    # Combine generic and topic-specific details
+    all_details = topic_details + GENERIC_DETAILS
+    
+    # Select a subset (between 5 and 8 items), seeded by the topic
+    rng = _topic_rng(topic)
+    num_details = min(len(all_details), rng.randint(5, 8))
+    selected_details = rng.sample(all_details, num_details)
+    
+    return tuple((detail, _keywords(detail)) for detail in selected_details)
+
+@functools.lru_cache(maxsize=64)
+def _render_placeholder(text, width, height, color):
+    """
+    Render a placeholder image and return (image bytes, mime type).
+    Rendering is deterministic, so results are cached per argument tuple.
+    """
+    # Create a blank image
+    img = Image.new('RGB', (width, height), color=color)
+    draw = ImageDraw.Draw(img)
+    
+    # Use a system font if available, otherwise the default font
+    font_size = 30
+    font = _get_font(font_size)
+    
+    # Draw border
+    border_width = 10
+    draw.rectangle((border_width, border_width, width - border_width, height - border_width),
+                   outline=_BORDER_COLOR, width=border_width)
+    
+    # Add text
+    text_width, text_height = _measure(text, font_size)
+    position = ((width - text_width) // 2, (height - text_height) // 2)
+    draw.text(position, text, fill=(100, 100, 100), font=font)
+    
+    # Add topic and style info if available
+    if ":" in text:
+        parts = text.split(":", 1)
+        if len(parts) > 1:
+            topic = parts[1].strip()
+            draw.text((20, height - 60), f"Topic: {topic}", fill=(100, 100, 100), font=font)
+    
+    # Add disclaimer
+    draw.text((20, height - 30), "FALLBACK MODE - API Unavailable", fill=(255, 0, 0), font=_SMALL_FONT)
+    
+    # Encode to PNG bytes; the data URL is only built on request (see to_data_url).
+    # The image is mostly flat color, so fast deflate gives nearly the same size
+    buffered = io.BytesIO()
+    img.save(buffered, format="PNG", compress_level=1)
+    image_bytes = buffered.getvalue()
+    
+    return image_bytes, 'image/png'
+
 class FallbackMode:
     """
     Provides fallback functionality when the VisoLearn API is unavailable.
@@ -17,123 +191,50 @@ class FallbackMode:
         Generate a simple placeholder image with text
         """
         try:
-            # Create a blank image
-            img = Image.new('RGB', (width, height), color=color)
-            draw = ImageDraw.Draw(img)
-            
-            # Try to use a system font, fall back to default if not available
-            try:
-                # Different font paths for different operating systems
-                if os.name == 'nt':  # Windows
-                    font_path = "C:\\Windows\\Fonts\\Arial.ttf"
-                elif os.name == 'posix':  # macOS or Linux
-                    if os.path.exists("/System/Library/Fonts/Helvetica.ttc"):  # macOS
-                        font_path = "/System/Library/Fonts/Helvetica.ttc"
-                    else:  # Linux
-                        font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
-                else:
-                    font_path = None
-                
-                if font_path and os.path.exists(font_path):
-                    font = ImageFont.truetype(font_path, 30)
-                else:
-                    font = ImageFont.load_default()
-            except Exception:
-                font = ImageFont.load_default()
-            
-            # Draw border
-            border_width = 10
-            draw.rectangle([(border_width, border_width), 
-                            (width - border_width, height - border_width)], 
-                          outline=(180, 180, 180), width=border_width)
-            
-            # Add text
-            text_width, text_height = draw.textsize(text, font=font) if hasattr(draw, 'textsize') else (200, 30)
-            position = ((width - text_width) // 2, (height - text_height) // 2)
-            draw.text(position, text, fill=(100, 100, 100), font=font)
-            
-            # Add topic and style info if available
-            if ":" in text:
-                parts = text.split(":", 1)
-                if len(parts) > 1:
-                    topic = parts[1].strip()
-                    draw.text((20, height - 60), f"Topic: {topic}", fill=(100, 100, 100), font=font)
-            
-            # Add disclaimer
-            small_font = ImageFont.load_default()
-            draw.text((20, height - 30), "FALLBACK MODE - API Unavailable", fill=(255, 0, 0), font=small_font)
-            
-            # Convert to data URL
-            buffered = io.BytesIO()
-            img.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode()
-            data_url = f"data:image/png;base64,{img_str}"
-            
-            # Create a dict similar to what the API would return
-            result = {
-                'url': data_url,
-                'path': None,
-                'size': len(buffered.getvalue()),
-                'mime_type': 'image/png',
-                'is_stream': False
-            }
-            
-            return result
+            image_bytes, mime_type = _render_placeholder(sys.intern(text), width, height, tuple(color))
         except Exception as e:
             print(f"Error generating placeholder image: {str(e)}")
             return None
+        
+        # Create a dict similar to what the API would return, plus the raw bytes
+        result = {
+            'url': None,
+            'bytes': image_bytes,
+            'path': None,
+            'size': len(image_bytes),
+            'mime_type': mime_type,
+            'is_stream': False
+        }
+        
+        return result
+    
+    @staticmethod
+    def to_data_url(result):
+        """
+        Build the base64 data URL for a placeholder image result, for use in HTML
+        """
+        if result.get('url'):
+            return result['url']
+        if pybase64 is not None:
+            img_str = pybase64.b64encode_as_string(result['bytes'])
+        else:
+            img_str = base64.b64encode(result['bytes']).decode()
+        return f"data:{result['mime_type']};base64,{img_str}"
     
     @staticmethod
     def generate_placeholder_checklist(topic="Unknown"):
         """
-        Generate a placeholder checklist based on the topic
+        Generate a placeholder checklist based on the topic.
+        The same topic always yields the same details, in the same order.
         """
-        # Generic details that could apply to many images
-        generic_details = [
-            "Background color",
-            "Main subject",
-            "Foreground elements",
-            "Lighting effects",
-            "Shadows and highlights",
-            "Texture patterns",
-            "Color scheme"
-        ]
-        
-        # Add topic-specific details if a topic is provided
-        topic_details = []
-        if topic and topic != "Unknown":
-            topic_words = topic.lower().split()
-            
-            # Animals
-            if any(word in topic_words for word in ["animal", "animals", "pet", "pets", "wildlife"]):
-                topic_details = ["Animal type", "Animal posture", "Animal coloring", "Habitat elements", "Animal features"]
-            
-            # People
-            elif any(word in topic_words for word in ["person", "people", "child", "children", "family"]):
-                topic_details = ["Person's expression", "Clothing items", "Posture or pose", "Hair style", "Action being performed"]
-            
-            # Nature
-            elif any(word in topic_words for word in ["nature", "landscape", "tree", "forest", "mountain", "ocean"]):
-                topic_details = ["Type of landscape", "Plant life", "Weather conditions", "Time of day", "Natural features"]
-            
-            # Objects
-            elif any(word in topic_words for word in ["object", "toy", "item", "tool"]):
-                topic_details = ["Object shape", "Object purpose", "Object material", "Object size", "Object color"]
-        
-        # Combine generic and topic-specific details
-        all_details = topic_details + generic_details
-        
-        # Select a random subset (between 5 and 8 items)
-        num_details = min(len(all_details), random.randint(5, 8))
-        selected_details = random.sample(all_details, num_details)
-        
-        # Create checklist items
+        # Create fresh checklist items from the cached selection
         checklist = []
-        for i, detail in enumerate(selected_details):
+        for i, (detail, keywords) in enumerate(_placeholder_details(topic)):
             checklist.append({
                 "detail": detail,
                 "identified": False,
-                "id": i
+                "id": i,
+                "_keywords": keywords
             })
         
         return checklist
@@ -141,7 +242,7 @@ class FallbackMode:
     @staticmethod
     def process_chat_message(message, checklist, active_session=None):
         """
-        Process a chat message and update the checklist
+        Process a chat message and update the checklist in place
         
         Args:
             message (str): The user's message
@@ -151,28 +252,30 @@ class FallbackMode:
         Returns:
             tuple: (response message, updated checklist)
         """
-        # Simple logic to update checklist based on message content
-        updated_checklist = checklist.copy()
+        # Remember what was already identified so new identifications can be counted
+        prev_identified = [item["identified"] for item in checklist]
+        
+        # Tokenize the message once (only words longer than 3 chars are matched)
+        message_keywords = _keywords(message)
         
         # Check each detail against the message
-        for i, item in enumerate(updated_checklist):
+        for item in checklist:
             # Don't process already identified items
             if item["identified"]:
                 continue
-                
+            
             # Simple word matching (in a real system, this would be more sophisticated)
-            detail_words = item["detail"].lower().split()
-            message_lower = message.lower()
+            detail_keywords = item.get("_keywords")
+            if detail_keywords is None:
+                detail_keywords = _keywords(item["detail"])
             
             # If any word from the detail is in the message, mark it as identified
-            for word in detail_words:
-                if len(word) > 3 and word in message_lower:  # Only check words longer than 3 chars
-                    updated_checklist[i]["identified"] = True
-                    break
+            if detail_keywords & message_keywords:
+                item["identified"] = True
         
         # Generate a simple response based on how many items were identified
-        newly_identified = sum(1 for i, item in enumerate(updated_checklist) 
-                              if item["identified"] and not checklist[i]["identified"])
+        newly_identified = sum(1 for item, was_identified in zip(checklist, prev_identified)
+                               if item["identified"] and not was_identified)
         
         if newly_identified > 0:
             response = f"Great job! You identified {newly_identified} new detail{'s' if newly_identified > 1 else ''}."
@@ -180,7 +283,7 @@ class FallbackMode:
                 response += " Your observation skills are excellent!"
         else:
             # Hint about unidentified details
-            unidentified = [item["detail"] for item in updated_checklist if not item["identified"]]
+            unidentified = [item["detail"] for item in checklist if not item["identified"]]
             if unidentified:
                 hint_item = random.choice(unidentified)
                 response = f"Good try! Can you tell me more about the {hint_item.lower()}?"
@@ -193,32 +296,41 @@ class FallbackMode:
             attempt_limit = active_session.get("attempt_limit")
             
             # If this would be the last attempt before reaching the limit
-            if attempt_count + 1 >= attempt_limit and not all(item["identified"] for item in updated_checklist):
+            if attempt_count + 1 >= attempt_limit and not all(item["identified"] for item in checklist):
                 response += "\n\nThis is your last attempt. After this, we'll move to a new image."
         
-        return response, updated_checklist
+        return response, checklist
     
     @staticmethod
-    def create_html_checklist(checklist):
+    def checklist_css():
         """
-        Create HTML representation of the checklist
+        Return the minified <style> block for the checklist, to be emitted once per page
         """
-        html = '<div id="checklist-container" style="background-color: #000000; color: #ffffff; padding: 15px; border-radius: 8px;">'
-        html += '<style>.checklist-item {display: flex; align-items: center; margin-bottom: 10px; padding: 8px; border-radius: 5px; transition: background-color 0.3s;} '
-        html += '.identified {background-color: #1e4620; text-decoration: line-through; color: #7fff7f;} '
-        html += '.not-identified {background-color: #222222; color: #ffffff;} '
-        html += '.checkmark {margin-right: 10px; font-size: 1.2em;}</style>'
-        
-        for item in checklist:
-            detail = item["detail"]
-            identified = item["identified"]
-            css_class = "identified" if identified else "not-identified"
-            checkmark = "✅" if identified else "❌"
-            
-            html += f'<div class="checklist-item {css_class}">'
-            html += f'<span class="checkmark">{checkmark}</span>'
-            html += f'<span>{detail}</span>'
-            html += '</div>'
-        
-        html += '</div>'
-        return html 
\ No newline at end of file
+        return CHECKLIST_CSS
+    
+    @staticmethod
+    def checklist_items_html(checklist):
+        """
+        Create the HTML for the checklist items only, without styles or container
+        """
+        return "".join(
+            ITEM_TEMPLATE.format(
+                cls="identified" if item["identified"] else "not-identified",
+                mk="✅" if item["identified"] else "❌",
+                d=item["detail"]
+            )
+            for item in checklist
+        )
+    
+    @staticmethod
+    def create_html_checklist(checklist, include_css=True):
+        """
+        Create HTML representation of the checklist.
+        Pass include_css=False when the page already has checklist_css().
+        """
+        parts = [HEADER_HTML]
+        if include_css:
+            parts.append(CHECKLIST_CSS)
+        parts.append(FallbackMode.checklist_items_html(checklist))
+        parts.append('</div>')
+        return "".join(parts) 
\ No newline at end of file
@@ -7,6 +7,7 @@ import os
 import sys
 import subprocess
 from dotenv import load_dotenv
+from gradio_client import Client
 
 # Load environment variables
 load_dotenv()
@@ -25,30 +26,26 @@ if not HF_TOKEN:
 # Set the NO_GRADIO_QUEUE environment variable
 os.environ["NO_GRADIO_QUEUE"] = "1"
 
-# Run the gradio client with --no-gradio-queue
-# This command directly uses the gradio_client with the option
-cmd = [
-    sys.executable, "-c",
+def test_connection():
     """
-from gradio_client import Client
-print("Initializing with --no-gradio-queue option...")
-try:
-    # Test connection to verify the flag works
-    client = Client(
-        "Compumacy/VisoLearn", 
-        hf_token="%s",
-        no_queue=True
-    )
-    print("Successfully initialized client with --no-gradio-queue")
-except Exception as e:
-    print(f"Error initializing client: {str(e)}")
-    """ % HF_TOKEN
-]
+    Test the gradio_client connection with the --no-gradio-queue option in this process
+    """
+    print("Initializing with --no-gradio-queue option...")
+    try:
+        # Test connection to verify the flag works
+        Client(
+            "Compumacy/VisoLearn", 
+            hf_token=HF_TOKEN,
+            no_queue=True
+        )
+        print("Successfully initialized client with --no-gradio-queue")
+    except Exception as e:
+        print(f"Error initializing client: {str(e)}")
 
 try:
     # Test the gradio_client first
     print("Testing gradio_client connection...")
-    subprocess.run(cmd, check=False)
+    test_connection()
     
     print(f"\nStarting the VisoLearn interface on port {PORT}...")
     # Start the Streamlit app
@@ -57,7 +54,14 @@ try:
         "--server.port", PORT,
         "--server.address", "0.0.0.0"
     ]
-    subprocess.run(streamlit_cmd)
+    if os.name == 'posix':
+        # Replace this process with Streamlit instead of waiting on a child process.
+        # exec does not flush Python's stdio buffers, so flush them first
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execvp(streamlit_cmd[0], streamlit_cmd)
+    else:
+        subprocess.run(streamlit_cmd)
     
 except KeyboardInterrupt:
     print("\nShutting down...")
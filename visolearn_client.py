@@ -4,9 +4,32 @@ import base64
 import json
 import requests
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from PIL import Image
 from gradio_client import Client
 
+# Use the SIMD-accelerated base64 codec when it is installed
+try:
+    import pybase64
+except ImportError:
+    pybase64 = None
+
+# How long to wait for a sleeping Space to wake up, and the poll backoff bounds
+WAKE_TIMEOUT = 60
+WAKE_POLL_INITIAL_DELAY = 0.5
+WAKE_POLL_MAX_DELAY = 4.0
+
+# Independent state endpoints fetched together by refresh_all, keyed by result name
+REFRESH_ENDPOINTS = {
+    "checklist": "/update_checklist_html",
+    "progress": "/update_progress_html",
+    "attempt_counter": "/update_attempt_counter",
+    "sessions": "/update_sessions",
+    "difficulty_label": "/update_difficulty_label"
+}
+
 class VisoLearnClient:
     """
     Client for interacting with the VisoLearn Gradio API hosted on Hugging Face Spaces.
@@ -23,6 +46,13 @@ class VisoLearnClient:
         self.hf_token = hf_token or os.environ.get("HF_TOKEN")
         self.space_name = "Compumacy/VisoLearn"
         self.client = None
+        
+        # Keep-alive session for the Hugging Face API; transient 5xx errors are retried
+        self._session = requests.Session()
+        self._session.headers.update({"Authorization": f"Bearer {self.hf_token}"})
+        retries = Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504], raise_on_status=False)
+        self._session.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=2, max_retries=retries))
+        
         self.initialized = self.initialize()
     
     def initialize(self):
@@ -32,10 +62,8 @@ class VisoLearnClient:
         
         try:
             # First check if the Space is available
-            headers = {"Authorization": f"Bearer {self.hf_token}"}
-            response = requests.get(
-                f"https://huggingface.co/api/spaces/{self.space_name}/runtime",
-                headers=headers
+            response = self._session.get(
+                f"https://huggingface.co/api/spaces/{self.space_name}/runtime"
             )
             
             if response.status_code != 200:
@@ -54,22 +82,23 @@ class VisoLearnClient:
                 # If space is sleeping, wake it up
                 if status == "SLEEPING":
                     print(f"Space {self.space_name} is sleeping. Waking it up...")
-                    wake_response = requests.post(
-                        f"https://huggingface.co/api/spaces/{self.space_name}/wake",
-                        headers=headers
+                    wake_response = self._session.post(
+                        f"https://huggingface.co/api/spaces/{self.space_name}/wake"
                     )
                     if wake_response.status_code == 200:
-                        # Wait for the space to wake up (max 60 seconds)
-                        for _ in range(12):  # 12 * 5 seconds = 60 seconds
-                            time.sleep(5)
-                            status_response = requests.get(
-                                f"https://huggingface.co/api/spaces/{self.space_name}/runtime",
-                                headers=headers
+                        # Wait for the space to wake up, polling with exponential backoff
+                        delay = WAKE_POLL_INITIAL_DELAY
+                        deadline = time.monotonic() + WAKE_TIMEOUT
+                        while time.monotonic() < deadline:
+                            time.sleep(min(delay, max(0, deadline - time.monotonic())))
+                            status_response = self._session.get(
+                                f"https://huggingface.co/api/spaces/{self.space_name}/runtime"
                             )
                             if status_response.status_code == 200:
                                 current_status = status_response.json().get("stage")
                                 if current_status == "RUNNING":
                                     break
+                            delay = min(delay * 1.7, WAKE_POLL_MAX_DELAY)
                     else:
                         raise ConnectionError(f"Failed to wake up the space {self.space_name}")
                 else:
@@ -284,27 +313,63 @@ class VisoLearnClient:
         except Exception as e:
             raise RuntimeError(f"Error updating difficulty label: {str(e)}")
     
+    def refresh_all(self):
+        """
+        Fetch the checklist, progress, attempt counter, sessions and difficulty label
+        in parallel instead of one round-trip after another
+        
+        Returns:
+            dict: Results keyed by "checklist", "progress", "attempt_counter",
+                "sessions" and "difficulty_label"
+        """
+        self._ensure_initialized()
+        
+        try:
+            # The worker threads only live for the duration of this call
+            with ThreadPoolExecutor(max_workers=len(REFRESH_ENDPOINTS)) as pool:
+                futures = {
+                    pool.submit(self.client.predict, api_name=api_name): name
+                    for name, api_name in REFRESH_ENDPOINTS.items()
+                }
+                
+                results = {}
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+            
+            return results
+        except Exception as e:
+            raise RuntimeError(f"Error refreshing session state: {str(e)}")
+    
     @staticmethod
     def process_data_url(data_url):
         """
         Process an image data URL and convert it to a PIL Image
         
         Args:
-            data_url (str): The data URL containing the image data
+            data_url (str or bytes): The data URL containing the image data, or the raw image bytes
         
         Returns:
             PIL.Image: The processed image
         """
         try:
-            if data_url and data_url.startswith("data:image"):
-                # Extract the base64 encoded image data
-                base64_data = data_url.split(",")[1]
-                # Decode the base64 data
+            # Raw image bytes need no base64 decoding
+            if isinstance(data_url, (bytes, bytearray, memoryview)):
+                return Image.open(io.BytesIO(data_url))
+            if not data_url or not data_url.startswith("data:image"):
+                return None
+            # Extract the base64 encoded image data after the header, with a single slice
+            comma = data_url.find(",")
+            if comma < 0:
+                return None
+            base64_data = data_url[comma + 1:]
+            # Decode the base64 data
+            if pybase64 is not None:
+                image_data = pybase64.b64decode(base64_data, validate=False)
+            else:
                 image_data = base64.b64decode(base64_data)
-                # Create a PIL Image
-                image = Image.open(io.BytesIO(image_data))
-                return image
-            return None
+            # Create a PIL Image
+            image = Image.open(io.BytesIO(image_data))
+            return image
         except Exception as e:
             print(f"Error processing image data URL: {str(e)}")
             return None 
\ No newline at end of file